@@ -52,7 +52,8 @@ export async function POST(request: Request) {
     
     // Query Pinecone
     console.log('Querying Pinecone...');
-    const index = pinecone.Index('running-shoes');
+    // PINECONE_INDEX_HOST can point at the local FAISS service (src/lib/vector_service.py)
+    const index = pinecone.Index('running-shoes', process.env.PINECONE_INDEX_HOST);
     const queryResponse = await index.query({
       vector: embeddingResponse.data[0].embedding,
       topK: 3,
@@ -105,7 +106,9 @@ export async function POST(request: Request) {
       )
       .map(match => ({
         title: match.metadata?.title || '',
-        video_id: match.metadata?.video_id || ''
+        video_id: match.metadata?.video_id || '',
+        // Seconds into the video where the chunk starts, for deep links
+        start: typeof match.metadata?.start === 'number' ? match.metadata.start : null
       }));
 
     // Return formatted response
@@ -13,6 +13,7 @@ interface Recommendation {
 interface Source {
   title: string;
   video_id: string;
+  start?: number | null;
 }
 
 function hasRecommendations(text: string): boolean {
@@ -213,7 +214,9 @@ export default function Home() {
                             className="mt-1 flex-shrink-0 text-[#FF9F1C]"
                           />
                           <a
-                            href={`https://youtube.com/watch?v=${source.video_id}`}
+                            href={`https://youtube.com/watch?v=${source.video_id}${
+                              source.start ? `&t=${Math.floor(source.start)}s` : ""
+                            }`}
                             target="_blank"
                             rel="noopener noreferrer"
                             className="text-xs md:text-sm text-[#E4D9FF] group-hover:text-[#FF9F1C] transition-colors"
@@ -0,0 +1,97 @@
+import http.client
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+from urllib.parse import urlparse
+
+import numpy as np
+from dotenv import load_dotenv
+
+from vector_store import ShoeKnowledgeBase
+
+load_dotenv()
+
+def summarize(latencies_ms: List[float]) -> Dict:
+    values = np.array(latencies_ms)
+    return {
+        'n': len(values),
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'p99': float(np.percentile(values, 99))
+    }
+
+def time_queries(run_query: Callable[[List[float]], None], vectors: np.ndarray, warmup: int = 5) -> Dict:
+    for vector in vectors[:warmup]:
+        run_query(vector.tolist())
+    latencies = []
+    for vector in vectors:
+        query = vector.tolist()
+        start = time.perf_counter()
+        run_query(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return summarize(latencies)
+
+def main():
+    """Compare top-k query latency: in-process FAISS, the local vector
+    service over HTTP, and remote Pinecone (if PINECONE_API_KEY is set).
+    The local backends use the advisor's MMR reranking; Pinecone returns
+    plain nearest neighbours.
+
+    Usage: python bench_vector_query.py [n_queries] [local_service_url]
+    """
+    n_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    service_url = sys.argv[2] if len(sys.argv) > 2 else os.getenv('VECTOR_SERVICE_URL', 'http://127.0.0.1:5080')
+    top_k = 3
+
+    kb = ShoeKnowledgeBase()
+    kb.load('shoe_knowledge')
+
+    # Query with perturbed stored vectors so results look like real traffic
+    rng = np.random.default_rng(0)
+    stored = kb.index.reconstruct_batch(np.array(list(kb.chunk_data), dtype=np.int64))
+    vectors = stored[rng.integers(0, len(stored), n_queries)]
+    vectors = vectors + rng.normal(scale=0.01, size=vectors.shape).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    results = {}
+
+    results['faiss (in-process)'] = time_queries(
+        lambda vector: kb.search_by_vector(np.array(vector, dtype=np.float32), k=top_k),
+        vectors
+    )
+
+    parsed = urlparse(service_url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80)
+    def local_query(vector):
+        conn.request('POST', '/query', body=json.dumps({
+            'vector': vector, 'topK': top_k, 'includeMetadata': True
+        }).encode('utf-8'), headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"Local service returned {response.status}")
+    try:
+        results['local service (http)'] = time_queries(local_query, vectors)
+    except (OSError, RuntimeError) as e:
+        print(f"Skipping local service at {service_url}: {e}")
+
+    if os.getenv('PINECONE_API_KEY'):
+        from pinecone import Pinecone
+        index = Pinecone(api_key=os.getenv('PINECONE_API_KEY')).Index('running-shoes')
+        results['pinecone (remote)'] = time_queries(
+            lambda vector: index.query(vector=vector, top_k=top_k, include_metadata=True),
+            vectors
+        )
+    else:
+        print("Skipping remote Pinecone: PINECONE_API_KEY not set")
+
+    print(f"\n{n_queries} queries, top_k={top_k}, {kb.index.ntotal} vectors (latency in ms)")
+    print(f"{'backend':<24}{'mean':>8}{'p50':>8}{'p95':>8}{'p99':>8}")
+    for name, stats in results.items():
+        print(f"{name:<24}{stats['mean']:>8.3f}{stats['p50']:>8.3f}{stats['p95']:>8.3f}{stats['p99']:>8.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+from pathlib import Path
+import json
+import os
+import zlib
+from typing import Dict, Iterator, List, Optional
+
+class CorpusStore:
+    """Compact on-disk store of video transcripts, one record per video.
+
+    Each record is a zlib-compressed JSON document appended to corpus.bin;
+    corpus.idx maps video_id to the record's (offset, length) so single videos
+    can be read without loading the rest. Only caption segments are stored:
+    the full transcript text is rebuilt from them on read.
+    """
+
+    DATA_FILE = 'corpus.bin'
+    INDEX_FILE = 'corpus.idx'
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.data_path = self.directory / self.DATA_FILE
+        self.index_path = self.directory / self.INDEX_FILE
+        self.index: Dict[str, List[int]] = {}
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return (Path(directory) / cls.INDEX_FILE).exists()
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def video_ids(self) -> List[str]:
+        return list(self.index)
+
+    def _encode(self, video: Dict) -> bytes:
+        record = {key: value for key, value in video.items() if key != 'transcript'}
+        transcript = video.get('transcript') or {}
+        record['segments'] = transcript.get('segments') or []
+        if not record['segments'] and transcript.get('text'):
+            # No caption segments to rebuild the text from, keep the text itself
+            record['text'] = transcript['text']
+        return zlib.compress(json.dumps(record, separators=(',', ':')).encode('utf-8'))
+
+    def _decode(self, data: bytes) -> Dict:
+        record = json.loads(zlib.decompress(data))
+        segments = record.pop('segments')
+        # Same text youtube_transcript_api's TextFormatter produces
+        text = record.pop('text', None)
+        record['transcript'] = {
+            'text': text if text is not None else '\n'.join(segment['text'] for segment in segments),
+            'segments': segments
+        }
+        return record
+
+    def put(self, video: Dict):
+        """Append a video record; a newer record for the same video replaces the old one"""
+        self.put_many([video])
+
+    def put_many(self, videos: List[Dict]):
+        """Append several video records and persist the index once"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.data_path, 'ab') as f:
+            for video in videos:
+                data = self._encode(video)
+                offset = f.tell()
+                f.write(data)
+                self.index[video['video_id']] = [offset, len(data)]
+        self._write_index()
+
+    def _write_index(self):
+        tmp_path = self.index_path.with_suffix('.idx.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def get(self, video_id: str) -> Optional[Dict]:
+        """Read a single video by id"""
+        if video_id not in self.index:
+            return None
+        offset, length = self.index[video_id]
+        with open(self.data_path, 'rb') as f:
+            f.seek(offset)
+            return self._decode(f.read(length))
+
+    def iter_videos(self) -> Iterator[Dict]:
+        """Stream every video in file order, one record in memory at a time"""
+        records = sorted(self.index.values())
+        if not records:
+            return
+        with open(self.data_path, 'rb') as f:
+            for offset, length in records:
+                f.seek(offset)
+                yield self._decode(f.read(length))
+
+    def garbage_bytes(self) -> int:
+        """Bytes of the data file taken by replaced or unindexed records"""
+        if not self.data_path.exists():
+            return 0
+        return self.data_path.stat().st_size - sum(length for _, length in self.index.values())
+
+    def compact(self):
+        """Rewrite the data file without records that were replaced.
+
+        Offsets change, so run this only from the process that writes the
+        store, not while other processes are reading it.
+        """
+        tmp_path = self.data_path.with_suffix('.bin.tmp')
+        new_index = {}
+        with open(self.data_path, 'rb') as f, open(tmp_path, 'wb') as out:
+            for video_id, (offset, length) in sorted(self.index.items(), key=lambda item: item[1]):
+                f.seek(offset)
+                new_index[video_id] = [out.tell(), length]
+                out.write(f.read(length))
+        os.replace(tmp_path, self.data_path)
+        self.index = new_index
+        self._write_index()
+
+
+def _read_legacy_json(channel_dir: Path) -> List[Dict]:
+    json_path = Path(channel_dir) / 'processed_videos.json'
+    if not json_path.exists():
+        return []
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def migrate_legacy_json(channel_dir: Path) -> int:
+    """Move videos from an older processed_videos.json dump into the channel's
+    corpus store, then delete the dump along with any transcripts/<id>.json
+    files of videos that are now in the store. Videos already in the store
+    keep their stored record. Returns how many videos were added.
+
+    Only the process that writes the store should call this.
+    """
+    channel_dir = Path(channel_dir)
+    store = CorpusStore(channel_dir)
+    videos = _read_legacy_json(channel_dir)
+    new_videos = [video for video in videos if video['video_id'] not in store and video.get('transcript')]
+    if new_videos:
+        store.put_many(new_videos)
+    (channel_dir / 'processed_videos.json').unlink(missing_ok=True)
+
+    transcript_dir = channel_dir / 'transcripts'
+    if transcript_dir.is_dir():
+        for transcript_path in transcript_dir.glob('*.json'):
+            if transcript_path.stem in store:
+                transcript_path.unlink()
+    return len(new_videos)
+
+
+def iter_channel_videos(channel_dir: Path) -> Iterator[Dict]:
+    """Stream a channel's videos from its corpus store, plus any videos from
+    an older processed_videos.json dump that haven't been migrated yet.
+    Read only: migration is left to youtube_transcript_getter.py."""
+    store = CorpusStore(channel_dir) if CorpusStore.exists(channel_dir) else None
+    if store is not None:
+        yield from store.iter_videos()
+    for video in _read_legacy_json(channel_dir):
+        if video.get('transcript') and (store is None or video['video_id'] not in store):
+            yield video
@@ -0,0 +1,464 @@
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SHOES = [
+    'Nike Pegasus 41', 'Hoka Clifton 9', 'Asics Novablast 4', 'Saucony Endorphin Speed 4',
+    'Brooks Ghost 16', 'New Balance 1080v14', 'Nike Vaporfly 3', 'Adidas Adios Pro 3',
+    'Hoka Mach 6', 'Puma Deviate Nitro 3', 'Asics Superblast 2', 'Saucony Ride 17',
+    'Nike Invincible 3', 'Brooks Hyperion Max 2', 'On Cloudmonster 2', 'Mizuno Neo Vista',
+    'Adidas Boston 12', 'New Balance SC Elite v4', 'Hoka Bondi 8', 'Saucony Triumph 22'
+]
+
+TEMPLATES = [
+    "I love the {shoe}, what else should I try?",
+    "{shoe}",
+    "Shoes similar to the {shoe} for marathon training",
+    "What's a good alternative to the {shoe}?"
+]
+
+EMBEDDING_DIM = 1536
+
+def fake_embedding(text: str) -> np.ndarray:
+    """Deterministic unit vector for a text, so identical questions embed identically"""
+    seed = int.from_bytes(hashlib.md5(text.encode()).digest()[:8], 'big')
+    vector = np.random.default_rng(seed).normal(size=EMBEDDING_DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeOpenAI:
+    """Local stand-in for the OpenAI embeddings and chat completions endpoints.
+
+    Each call sleeps for the configured latency before answering, and counts
+    how many upstream calls the advisor actually made (GET /stats). Runs in
+    its own process (see FakeOpenAIProcess) so its CPU and memory don't show
+    up in the advisor's numbers.
+    """
+
+    def __init__(self, embed_latency_ms: float, chat_latency_ms: float):
+        self.embed_latency = embed_latency_ms / 1000
+        self.chat_latency = chat_latency_ms / 1000
+        self.counts = {'embeddings': 0, 'chat': 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.server.daemon_threads = True
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.counts)
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _embeddings(self, body: Dict) -> Dict:
+        time.sleep(self.embed_latency)
+        self._count('embeddings')
+        inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_embedding(text)
+            # The openai client asks for base64 when numpy is installed
+            if body.get('encoding_format') == 'base64':
+                embedding = base64.b64encode(vector.tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({'object': 'embedding', 'index': i, 'embedding': embedding})
+        return {
+            'object': 'list',
+            'data': data,
+            'model': body.get('model'),
+            'usage': {'prompt_tokens': 1, 'total_tokens': 1}
+        }
+
+    def _chat(self, body: Dict) -> Dict:
+        time.sleep(self.chat_latency)
+        self._count('chat')
+        return {
+            'id': 'chatcmpl-load-test',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model'),
+            'choices': [{
+                'index': 0,
+                'message': {
+                    'role': 'assistant',
+                    'content': "- **Nike Pegasus 41**\n  - A solid daily trainer.\n"
+                               "- **Hoka Clifton 9**\n  - Soft and light for easy miles."
+                },
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+        }
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if self.path.endswith('/embeddings'):
+                    payload = fake._embeddings(body)
+                elif self.path.endswith('/chat/completions'):
+                    payload = fake._chat(body)
+                else:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                data = json.dumps(fake.snapshot()).encode('utf-8')
+                self.send_response(200 if self.path == '/stats' else 404)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _serve_fake_openai(embed_latency_ms: float, chat_latency_ms: float, conn):
+    fake = FakeOpenAI(embed_latency_ms, chat_latency_ms)
+    conn.send(fake.server.server_address[1])
+    conn.close()
+    fake.server.serve_forever()
+
+
+class FakeOpenAIProcess:
+    """Runs FakeOpenAI in a child process and reads its call counters"""
+
+    def __init__(self, embed_latency_ms: float, chat_latency_ms: float):
+        context = multiprocessing.get_context('spawn')
+        parent_conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_serve_fake_openai,
+            args=(embed_latency_ms, chat_latency_ms, child_conn),
+            daemon=True
+        )
+        self.process.start()
+        self.port = parent_conn.recv()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def snapshot(self) -> Dict:
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/stats") as response:
+            return json.load(response)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+
+class QuestionMix:
+    """Realistic question stream: shoe popularity follows a Zipf law, and a
+    fraction of questions repeat an earlier one verbatim"""
+
+    def __init__(self, zipf_s: float = 1.1, repeat_rate: float = 0.3, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.repeat_rate = repeat_rate
+        self.weights = [1 / (rank ** zipf_s) for rank in range(1, len(SHOES) + 1)]
+        self.history: List[str] = []
+
+    def next(self) -> str:
+        if self.history and self.rng.random() < self.repeat_rate:
+            return self.rng.choice(self.history)
+        shoe = self.rng.choices(SHOES, weights=self.weights)[0]
+        question = self.rng.choice(TEMPLATES).format(shoe=shoe)
+        self.history.append(question)
+        return question
+
+    def take(self, n: int) -> List[str]:
+        return [self.next() for _ in range(n)]
+
+
+def build_synthetic_kb(directory: Path):
+    """Small knowledge base embedded with fake_embedding, for runs without real data"""
+    from vector_store import ShoeKnowledgeBase
+
+    kb = ShoeKnowledgeBase()
+    chunks = []
+    for video, shoe in enumerate(SHOES):
+        for i in range(20):
+            text = f"Review of the {shoe}, part {i}: ride, fit, cushioning and durability."
+            chunks.append({
+                'embedding': fake_embedding(text),
+                'text': text,
+                'metadata': {'title': f"{shoe} review", 'video_id': f"video{video}", 'chunk_index': i}
+            })
+    kb.upsert_embeddings(chunks)
+    kb.save(str(directory))
+
+
+def maxrss_mb(ru_maxrss: int) -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return ru_maxrss / (1024 * 1024) if sys.platform == 'darwin' else ru_maxrss / 1024
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident set size of this process right now (Linux only)"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class RssSampler:
+    """Samples this process's current RSS in the background and keeps the
+    peak, so each concurrency level reports its own memory use rather than
+    the process's lifetime peak"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            rss = current_rss_mb()
+            if rss is not None:
+                self.peak = rss if self.peak is None else max(self.peak, rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class SubprocessTarget:
+    """One `python main.py <question>` process per request"""
+
+    def __init__(self, env: Dict):
+        self.env = env
+        self.main_py = Path(__file__).resolve().parent / 'main.py'
+
+    def use_workdir(self, workdir: Path):
+        # main.py reads shoe_knowledge/ and query_cache/ relative to its cwd
+        self.workdir = workdir
+
+    def ask(self, question: str) -> Dict:
+        proc = subprocess.Popen(
+            [sys.executable, str(self.main_py), question],
+            cwd=self.workdir, env=self.env,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        output = proc.stdout.read()
+        proc.stdout.close()
+        # wait4 gives the CPU time and peak RSS of this worker alone
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        response = json.loads(output) if output else {'error': 'No output'}
+        return {
+            'ok': proc.returncode == 0 and 'error' not in response,
+            'cpu_s': usage.ru_utime + usage.ru_stime,
+            'rss_mb': maxrss_mb(usage.ru_maxrss)
+        }
+
+    def begin(self):
+        pass
+
+    def end(self):
+        pass
+
+    def usage(self) -> Optional[Dict]:
+        return None
+
+
+class InProcessTarget:
+    """One shared ShoeAdvisor called from worker threads, like a long-running
+    server. The advisor is built once; each level only swaps in a fresh cache."""
+
+    def __init__(self, kb_directory: Path):
+        from shoe_advisor import ShoeAdvisor
+
+        # shoe_advisor logs every request at DEBUG; keep the harness output readable
+        logging.getLogger().setLevel(logging.WARNING)
+        self.advisor = ShoeAdvisor(kb_directory=str(kb_directory))
+
+    def use_workdir(self, workdir: Path):
+        from query_cache import QueryCache
+
+        self.advisor.cache = QueryCache(str(workdir / 'query_cache'))
+
+    def begin(self):
+        self.start = resource.getrusage(resource.RUSAGE_SELF)
+        self.rss_sampler = RssSampler()
+        self.rss_sampler.start()
+
+    def ask(self, question: str) -> Dict:
+        response = self.advisor.get_response(question)
+        return {'ok': 'error' not in response}
+
+    def end(self):
+        # Hits are only written to the shared stats when the cache flushes them
+        self.advisor.cache.flush_stats()
+
+    def usage(self) -> Dict:
+        """CPU and peak sampled RSS of the advisor process during this level.
+        The OpenAI stand-in runs in another process, so it isn't counted."""
+        end = resource.getrusage(resource.RUSAGE_SELF)
+        self.rss_sampler.stop()
+        cpu_s = (end.ru_utime - self.start.ru_utime) + (end.ru_stime - self.start.ru_stime)
+        return {'cpu_s': cpu_s, 'rss_mb': self.rss_sampler.peak}
+
+
+def run_level(target, questions: List[str], concurrency: int, fake: FakeOpenAIProcess, cache_dir: Path) -> Dict:
+    from query_cache import QueryCache
+
+    before = fake.snapshot()
+    target.begin()
+
+    def one(question):
+        start = time.perf_counter()
+        result = target.ask(question)
+        result['latency_ms'] = (time.perf_counter() - start) * 1000
+        return result
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, questions))
+    wall = time.perf_counter() - wall_start
+
+    after = fake.snapshot()
+    target.end()
+    latencies = np.array([r['latency_ms'] for r in results])
+    ok = sum(r['ok'] for r in results)
+    # The cache counts its own outcomes: served from cache, waited on another
+    # caller's upstream call, or made the call itself
+    cache_stats = QueryCache(str(cache_dir)).shared_stats()
+
+    usage = target.usage()
+    if usage is None:
+        cpu_s = sum(r['cpu_s'] for r in results)
+        rss_mb = float(np.mean([r['rss_mb'] for r in results]))
+    else:
+        cpu_s, rss_mb = usage['cpu_s'], usage['rss_mb']
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'errors': len(results) - ok,
+        'throughput_rps': len(results) / wall,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p90_ms': float(np.percentile(latencies, 90)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': float(latencies.max()),
+        'cache_hits': cache_stats.get('hit', 0),
+        'cache_hit_rate': cache_stats.get('hit', 0) / len(results),
+        'coalesced': cache_stats.get('coalesced', 0),
+        'leaders': cache_stats.get('leader', 0),
+        'upstream_embeddings': after['embeddings'] - before['embeddings'],
+        'upstream_chats': after['chat'] - before['chat'],
+        'cpu_ms_per_request': cpu_s * 1000 / len(results),
+        'rss_mb': rss_mb
+    }
+
+
+def print_report(rows: List[Dict], args):
+    print(f"\nmode={args.mode} requests/level={args.requests} zipf_s={args.zipf_s} "
+          f"repeat_rate={args.repeat_rate} embed={args.embed_latency_ms}ms chat={args.chat_latency_ms}ms")
+    header = f"{'conc':>5}{'rps':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'hit%':>7}{'coal':>6}{'err':>5}{'cpu ms/req':>12}{'rss MB':>9}"
+    print(header)
+    for row in rows:
+        print(f"{row['concurrency']:>5}{row['throughput_rps']:>8.1f}{row['p50_ms']:>9.1f}{row['p90_ms']:>9.1f}"
+              f"{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}{row['cache_hit_rate'] * 100:>7.1f}{row['coalesced']:>6}"
+              f"{row['errors']:>5}{row['cpu_ms_per_request']:>12.1f}"
+              f"{row['rss_mb'] if row['rss_mb'] is None else format(row['rss_mb'], '.1f'):>9}")
+
+
+def main():
+    """Replay a realistic question mix against the advisor at several
+    concurrency levels, with OpenAI replaced by a local stand-in"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--mode', choices=['subprocess', 'inprocess'], default='subprocess',
+                        help="spawn main.py per request, or share one ShoeAdvisor across threads")
+    parser.add_argument('--concurrency', default='1,2,4,8,16',
+                        help="comma separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=100, help="requests per concurrency level")
+    parser.add_argument('--zipf-s', type=float, default=1.1, help="Zipf exponent over shoe names")
+    parser.add_argument('--repeat-rate', type=float, default=0.3,
+                        help="probability a question repeats an earlier one verbatim")
+    parser.add_argument('--embed-latency-ms', type=float, default=50.0)
+    parser.add_argument('--chat-latency-ms', type=float, default=800.0)
+    parser.add_argument('--kb-dir', help="existing knowledge base (default: build a synthetic one)")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    fake = FakeOpenAIProcess(args.embed_latency_ms, args.chat_latency_ms)
+    os.environ['OPENAI_BASE_URL'] = fake.base_url
+    os.environ['OPENAI_API_KEY'] = 'load-test'
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix='shoe-load-') as tmp:
+        tmp = Path(tmp)
+        if args.kb_dir:
+            kb_dir = Path(args.kb_dir).resolve()
+        else:
+            kb_dir = tmp / 'shoe_knowledge'
+            build_synthetic_kb(kb_dir)
+
+        if args.mode == 'subprocess':
+            target = SubprocessTarget(dict(os.environ))
+        else:
+            target = InProcessTarget(kb_dir)
+
+        for level, concurrency in enumerate(int(c) for c in args.concurrency.split(',')):
+            # Fresh cache per level so hit rates are comparable
+            workdir = tmp / f"level_{concurrency}"
+            workdir.mkdir()
+            (workdir / 'shoe_knowledge').symlink_to(kb_dir, target_is_directory=True)
+            target.use_workdir(workdir)
+
+            questions = QuestionMix(args.zipf_s, args.repeat_rate, seed=level).take(args.requests)
+            row = run_level(target, questions, concurrency, fake, workdir / 'query_cache')
+            rows.append(row)
+            print(f"concurrency {concurrency}: {row['throughput_rps']:.1f} req/s, p99 {row['p99_ms']:.0f} ms",
+                  file=sys.stderr)
+
+    fake.stop()
+    print_report(rows, args)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
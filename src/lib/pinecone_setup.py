@@ -1,11 +1,12 @@
 import os
 from pathlib import Path
-import json
 from openai import OpenAI
 from pinecone import Pinecone
 from dotenv import load_dotenv
 from typing import List, Dict
 import time
+from corpus_store import iter_channel_videos
+from process_transcripts import TranscriptChunker
 
 load_dotenv()
 
@@ -13,43 +14,25 @@ class VideoProcessor:
     def __init__(self):
         self.openai_client = OpenAI()
         self.pinecone = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
+        # Same chunker as process_transcripts.py, so chunk ids mean the same text everywhere
+        self.chunker = TranscriptChunker()
         
-    def chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
-        """Split text into overlapping chunks"""
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            # Find a good breakpoint near the chunk size
-            end = start + chunk_size
-            if end < len(text):
-                # Try to break at a sentence or period
-                while end > start and text[end] not in '.!?\n':
-                    end -= 1
-                if end == start:  # If no good breakpoint found
-                    end = start + chunk_size
-                    
-            chunk = text[start:end].strip()
-            if chunk:  # Only add non-empty chunks
-                chunks.append(chunk)
-            
-            # Move start position, accounting for overlap
-            start = end - overlap
-            if start < 0:
-                start = 0
-                
-        return chunks
-
     def process_video_chunks(self, video: Dict) -> List[Dict]:
         """Process a video into chunks with embeddings"""
         if 'transcript' not in video or 'text' not in video['transcript']:
             print(f"No transcript found for video: {video.get('title', 'Unknown')}")
             return []
             
-        chunks = self.chunk_text(video['transcript']['text'])
+        chunks = self.chunker.split_into_chunks(
+            video['transcript']['text'],
+            video['title'],
+            video['video_id'],
+            segments=video['transcript'].get('segments')
+        )
         chunk_data = []
         
-        for i, chunk_text in enumerate(chunks):
+        for i, chunk in enumerate(chunks):
+            chunk_text = chunk.text
             try:
                 # Rate limiting - OpenAI has a rate limit
                 time.sleep(0.1)
@@ -68,7 +51,9 @@ class VideoProcessor:
                         'title': video['title'],
                         'video_id': video['video_id'],
                         'chunk_text': chunk_text,
-                        'chunk_index': i
+                        'chunk_index': i,
+                        # Segment timestamps (seconds) for deep links, when captions had them
+                        **{key: chunk.metadata[key] for key in ('start', 'end') if key in chunk.metadata}
                     }
                 })
                 
@@ -86,7 +71,8 @@ class VideoProcessor:
         index_name = 'running-shoes'
         
         try:
-            index = self.pinecone.Index(index_name)
+            # PINECONE_INDEX_HOST can point at vector_service.py to fill the local index instead
+            index = self.pinecone.Index(index_name, host=os.getenv('PINECONE_INDEX_HOST', ''))
             print(f"Connected to existing index: {index_name}")
         except Exception as e:
             print(f"Error connecting to index: {e}")
@@ -100,22 +86,16 @@ class VideoProcessor:
             if not channel_dir.is_dir():
                 continue
                 
-            json_path = channel_dir / 'processed_videos.json'
-            if not json_path.exists():
-                continue
-                
             print(f"\nProcessing channel: {channel_dir.name}")
-            
-            with open(json_path, 'r', encoding='utf-8') as f:
-                videos = json.load(f)
                 
             # Process each video
-            for video in videos:
+            for video in iter_channel_videos(channel_dir):
                 print(f"\nProcessing video: {video['title']}")
                 chunks = self.process_video_chunks(video)
                 all_chunks.extend(chunks)
                 
-                # Upload chunks in batches
+                # Upload chunks in batches, never splitting a video across two
+                # requests (the local vector service replaces videos per request)
                 if len(all_chunks) >= 100:
                     index.upsert(vectors=all_chunks)
                     print(f"Uploaded {len(all_chunks)} chunks to Pinecone")
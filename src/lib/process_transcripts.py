@@ -1,8 +1,10 @@
 from pathlib import Path
+import bisect
 import json
 import re
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
+from corpus_store import iter_channel_videos
 
 @dataclass
 class TextChunk:
@@ -10,6 +12,14 @@ class TextChunk:
     metadata: Dict
     
 class TranscriptChunker:
+    """Sentence-aligned chunks of about chunk_size characters, each starting
+    with up to overlap characters of the previous chunk's last sentences.
+
+    Sentences longer than chunk_size (auto-generated captions have no
+    punctuation at all) are split at caption segment boundaries, or between
+    words when there are no segments.
+    """
+
     def __init__(self, chunk_size: int = 1000, overlap: int = 100):
         self.chunk_size = chunk_size
         self.overlap = overlap
@@ -21,53 +31,112 @@ class TranscriptChunker:
         text = re.sub(r'\s+', ' ', text)
         return text.strip()
     
-    def split_into_chunks(self, text: str, title: str, video_id: str) -> List[TextChunk]:
-        """Split text into overlapping chunks while trying to maintain sentence boundaries"""
-        text = self.clean_text(text)
+    def _segments_text(self, segments: List[Dict]) -> Tuple[str, List[int]]:
+        """Join cleaned caption segments, returning the text and the
+        character offset where each segment starts"""
+        parts = []
+        offsets = []
+        position = 0
+        for segment in segments:
+            offsets.append(position)
+            cleaned = self.clean_text(segment['text'])
+            if cleaned:
+                parts.append(cleaned)
+                position += len(cleaned) + 1
+        return ' '.join(parts), offsets
+    
+    def _split_long_sentence(self, text: str, position: int, sentence: str,
+                             offsets: Optional[List[int]]) -> List[Tuple[int, str]]:
+        """Break a sentence at the caption segment boundaries inside it, then
+        any piece still longer than chunk_size between words"""
+        end = position + len(sentence)
+        pieces = []
+        if offsets:
+            start = position
+            # Segments are joined with single spaces, so a cut at offset o ends the piece at o - 1
+            for cut in sorted(set(offsets[bisect.bisect_right(offsets, position):bisect.bisect_left(offsets, end)])):
+                pieces.append((start, text[start:cut - 1]))
+                start = cut
+            pieces.append((start, text[start:end]))
+        else:
+            pieces.append((position, sentence))
+
+        units = []
+        for start, piece in pieces:
+            if len(piece) > self.chunk_size:
+                units.extend((start + word.start(), word.group()) for word in re.finditer(r'\S+', piece))
+            elif piece:
+                units.append((start, piece))
+        return units
+    
+    def split_into_chunks(self, text: str, title: str, video_id: str,
+                          segments: Optional[List[Dict]] = None) -> List[TextChunk]:
+        """Split text into overlapping chunks while trying to maintain sentence boundaries.
+
+        If the caption segments are given, the text is rebuilt from them and
+        each chunk's metadata gets the 'start' and 'end' time in seconds of
+        the segments it covers.
+        """
+        offsets = None
+        if segments:
+            text, offsets = self._segments_text(segments)
+        else:
+            text = self.clean_text(text)
         chunks = []
         
-        # Split into sentences (crude but functional for now)
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        def make_chunk(chunk_sentences: List[Tuple[int, str]]) -> TextChunk:
+            chunk_text = ' '.join(sentence for _, sentence in chunk_sentences)
+            metadata = {
+                'title': title,
+                'video_id': video_id,
+                'length': len(chunk_text),
+                'chunk_index': len(chunks)
+            }
+            if segments:
+                first = bisect.bisect_right(offsets, chunk_sentences[0][0]) - 1
+                last_char = chunk_sentences[-1][0] + len(chunk_sentences[-1][1]) - 1
+                last = bisect.bisect_right(offsets, last_char) - 1
+                metadata['start'] = segments[first]['start']
+                metadata['end'] = segments[last]['start'] + segments[last].get('duration', 0)
+            return TextChunk(text=chunk_text, metadata=metadata)
+        
+        # Split into sentences (crude but functional for now). Text is
+        # single-spaced, so each sentence starts one character after the last
+        sentences = []
+        position = 0
+        for sentence in re.split(r'(?<=[.!?])\s+', text):
+            if len(sentence) > self.chunk_size:
+                sentences.extend(self._split_long_sentence(text, position, sentence, offsets))
+            else:
+                sentences.append((position, sentence))
+            position += len(sentence) + 1
         
         current_chunk = []
         current_length = 0
         
         for sentence in sentences:
-            sentence_length = len(sentence)
+            sentence_length = len(sentence[1])
             
-            if current_length + sentence_length > self.chunk_size and current_chunk:
+            # Count the spaces the pieces are joined with, which matter for short pieces
+            if current_length + len(current_chunk) + sentence_length > self.chunk_size and current_chunk:
                 # Create chunk with metadata
-                chunk_text = ' '.join(current_chunk)
-                chunks.append(TextChunk(
-                    text=chunk_text,
-                    metadata={
-                        'title': title,
-                        'video_id': video_id,
-                        'length': len(chunk_text),
-                        'chunk_index': len(chunks)
-                    }
-                ))
+                chunks.append(make_chunk(current_chunk))
                 
-                # Keep some sentences for overlap
-                overlap_start = max(0, len(current_chunk) - self.overlap)
+                # Carry over trailing sentences up to `overlap` characters
+                overlap_start = len(current_chunk)
+                overlap_length = 0
+                while overlap_start > 0 and overlap_length + len(current_chunk[overlap_start - 1][1]) <= self.overlap:
+                    overlap_start -= 1
+                    overlap_length += len(current_chunk[overlap_start][1])
                 current_chunk = current_chunk[overlap_start:]
-                current_length = sum(len(s) for s in current_chunk)
+                current_length = sum(len(s) for _, s in current_chunk)
             
             current_chunk.append(sentence)
             current_length += sentence_length
         
         # Don't forget the last chunk
         if current_chunk:
-            chunk_text = ' '.join(current_chunk)
-            chunks.append(TextChunk(
-                text=chunk_text,
-                metadata={
-                    'title': title,
-                    'video_id': video_id,
-                    'length': len(chunk_text),
-                    'chunk_index': len(chunks)
-                }
-            ))
+            chunks.append(make_chunk(current_chunk))
         
         return chunks
 
@@ -81,22 +150,16 @@ def process_transcripts():
         if not channel_dir.is_dir():
             continue
         
-        json_path = channel_dir / 'processed_videos.json'
-        if not json_path.exists():
-            continue
-        
-        with open(json_path, 'r', encoding='utf-8') as f:
-            videos = json.load(f)
-        
         # Process each video
-        for video in videos:
+        for video in iter_channel_videos(channel_dir):
             if 'transcript' not in video or 'text' not in video['transcript']:
                 continue
                 
             chunks = chunker.split_into_chunks(
                 video['transcript']['text'],
                 video['title'],
-                video['video_id']
+                video['video_id'],
+                segments=video['transcript'].get('segments')
             )
             all_chunks.extend(chunks)
     
@@ -104,8 +167,14 @@ def process_transcripts():
     chunks_dir = Path('processed_chunks')
     chunks_dir.mkdir(exist_ok=True)
     
-    for i, chunk in enumerate(all_chunks):
-        chunk_file = chunks_dir / f'chunk_{i:04d}.json'
+    # Every video is rechunked above, so drop the previous run's files;
+    # leftovers would be picked up again by vector_store.py
+    for old_file in chunks_dir.glob('chunk_*.json'):
+        old_file.unlink()
+    
+    for chunk in all_chunks:
+        # Named per video so a file always holds the same chunk of the same video
+        chunk_file = chunks_dir / f"chunk_{chunk.metadata['video_id']}_{chunk.metadata['chunk_index']:04d}.json"
         with open(chunk_file, 'w', encoding='utf-8') as f:
             json.dump({
                 'text': chunk.text,
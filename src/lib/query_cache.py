@@ -1,53 +1,299 @@
 from pathlib import Path
+import atexit
 import hashlib
+import json
+import os
+import threading
 import time
 import pickle
 import logging
+from typing import Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 class QueryCache:
-    def __init__(self, cache_dir: str = 'query_cache', ttl_days: int = 30):
+    # Leases and failure markers live in a fixed set of slot files picked by
+    # hashing the cache key, so they don't pile up one per distinct query
+    LOCK_SLOTS = 256
+
+    def __init__(self, cache_dir: str = 'query_cache', ttl_days: int = 30,
+                 wait_timeout_seconds: float = 30.0, poll_interval_seconds: float = 0.05,
+                 failure_ttl_seconds: float = 10.0):
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
         self.ttl_seconds = ttl_days * 24 * 60 * 60
+
+        # Single-flight settings: waiters give up after wait_timeout_seconds,
+        # and a leader's failure is shared with waiters for failure_ttl_seconds
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+
+        # Open lease file descriptors we hold a lock on, by cache key
+        self._leases: Dict[str, int] = {}
+        self.lock_dir = self.cache_dir / 'locks'
+        self.lock_dir.mkdir(exist_ok=True)
+
+        # Counters for this process. Misses are appended to the shared stats
+        # log as they happen; hits only add up in memory and are appended once
+        # by flush_stats() (at exit), so the hit path never touches the log
+        self.stats = {
+            'hit': 0,
+            'leader': 0,
+            'coalesced': 0,
+            'failed_waits': 0,
+            'wait_timeouts': 0
+        }
+        self._stats_lock = threading.Lock()
+        self._unflushed_hits = 0
+        self.stats_file = self.cache_dir / 'single_flight_stats.log'
+        atexit.register(self.flush_stats)
         logging.debug(f"Cache initialized at {self.cache_dir}")
-        
+
     def _get_cache_key(self, query: str) -> str:
         """Create deterministic cache key from query"""
         return hashlib.md5(query.lower().strip().encode()).hexdigest()
-    
+
     def _is_valid(self, timestamp: float) -> bool:
         """Check if cached item is still valid"""
         return (time.time() - timestamp) < self.ttl_seconds
-    
+
     def get(self, query: str) -> dict:
         """Get cached response if it exists and is valid"""
         cache_key = self._get_cache_key(query)
         cache_file = self.cache_dir / f"{cache_key}.pkl"
-        
+
         logging.debug(f"Looking for cache file: {cache_file}")
-        
-        if cache_file.exists():
+
+        try:
             with open(cache_file, 'rb') as f:
                 cached_data = pickle.load(f)
-                if self._is_valid(cached_data['timestamp']):
-                    logging.debug("Cache hit!")
-                    return cached_data['response']
-                else:
-                    logging.debug("Cache expired")
-                    cache_file.unlink()  # Remove expired cache
-        logging.debug("Cache miss")
+        except FileNotFoundError:
+            logging.debug("Cache miss")
+            return None
+
+        if self._is_valid(cached_data['timestamp']):
+            logging.debug("Cache hit!")
+            return cached_data['response']
+
+        logging.debug("Cache expired")
+        cache_file.unlink(missing_ok=True)  # Remove expired cache
         return None
-    
+
     def set(self, query: str, response: dict):
         """Cache a response"""
         cache_key = self._get_cache_key(query)
         cache_file = self.cache_dir / f"{cache_key}.pkl"
-        
+
         cache_data = {
             'timestamp': time.time(),
             'response': response
         }
-        
-        with open(cache_file, 'wb') as f:
+
+        # Write to a private temp file and rename so concurrent writers and
+        # readers never see a half-written pickle
+        tmp_file = self.cache_dir / f"{cache_key}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+        with open(tmp_file, 'wb') as f:
             pickle.dump(cache_data, f)
-        logging.debug(f"Cached response at {cache_file}")
\ No newline at end of file
+        os.replace(tmp_file, cache_file)
+        logging.debug(f"Cached response at {cache_file}")
+
+    def _lock_fd(self, fd: int) -> bool:
+        """Try to take an exclusive lock on an open file without blocking.
+
+        The OS drops the lock when the descriptor is closed or the process
+        dies, so a crashed leader never leaves a stale lease behind.
+        """
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock_fd(self, fd: int):
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def _slot_file(self, cache_key: str, suffix: str) -> Path:
+        """Slot file shared by every cache key that hashes to the same slot"""
+        return self.lock_dir / f"slot_{int(cache_key, 16) % self.LOCK_SLOTS:03d}{suffix}"
+
+    def _try_lock(self, cache_key: str) -> int:
+        """Lock the key's lease slot, returning the open fd or -1 if it is held.
+
+        Two queries that share a slot just take turns computing. Slot files
+        are never unlinked: removing a locked file would let the next caller
+        lock a fresh inode while the old holder still runs.
+        """
+        fd = os.open(self._slot_file(cache_key, '.lease'), os.O_CREAT | os.O_RDWR)
+        if self._lock_fd(fd):
+            return fd
+        os.close(fd)
+        return -1
+
+    def acquire_lease(self, query: str) -> bool:
+        """Become the single caller allowed to compute a response for this query"""
+        cache_key = self._get_cache_key(query)
+        fd = self._try_lock(cache_key)
+        if fd < 0:
+            return False
+        self._leases[cache_key] = fd
+        return True
+
+    def release_lease(self, query: str):
+        """Release a lease taken with acquire_lease"""
+        fd = self._leases.pop(self._get_cache_key(query), None)
+        if fd is not None:
+            self._unlock_fd(fd)
+
+    def _record_failure(self, query: str, error: Exception):
+        """Tell current waiters that the leader's upstream call failed"""
+        cache_key = self._get_cache_key(query)
+        failure_file = self._slot_file(cache_key, '.failed')
+        tmp_file = failure_file.with_suffix(f".{os.getpid()}.{time.monotonic_ns()}.tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump({'key': cache_key, 'timestamp': time.time(), 'error': str(error)}, f)
+        os.replace(tmp_file, failure_file)
+
+    def _recent_failure(self, query: str, since: float) -> Optional[str]:
+        """Error message of a leader failure for this query recorded after `since`, if any"""
+        cache_key = self._get_cache_key(query)
+        try:
+            with open(self._slot_file(cache_key, '.failed'), 'r') as f:
+                failure = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if failure.get('key') != cache_key:
+            return None
+        if failure['timestamp'] >= since and (time.time() - failure['timestamp']) < self.failure_ttl_seconds:
+            return failure['error']
+        return None
+
+    def get_or_compute(self, query: str, compute: Callable[[], dict],
+                       cacheable: Callable[[dict], bool] = lambda response: True) -> dict:
+        """Return the cached response, or compute it once across all processes.
+
+        The first caller to miss takes a lease and runs compute(); concurrent
+        callers for the same query wait for its result instead of repeating
+        the upstream calls. If the leader's compute() raises, the callers that
+        were waiting on it raise too rather than retrying one after another.
+        Responses for which cacheable() is false are returned but not stored.
+        """
+        cached_response = self.get(query)
+        if cached_response is not None:
+            self._record('hit')
+            return cached_response
+
+        wait_start = time.time()
+        deadline = time.monotonic() + self.wait_timeout_seconds
+        waited = False
+
+        while True:
+            if self.acquire_lease(query):
+                try:
+                    # Another leader may have finished between our miss and the lease
+                    cached_response = self.get(query)
+                    if cached_response is not None:
+                        self._record('coalesced' if waited else 'hit')
+                        return cached_response
+                    if waited:
+                        self._raise_if_failed(query, wait_start)
+
+                    self._record('leader')
+                    try:
+                        response = compute()
+                    except Exception as e:
+                        self._record_failure(query, e)
+                        raise
+                    if cacheable(response):
+                        self.set(query, response)
+                    return response
+                finally:
+                    self.release_lease(query)
+
+            if not waited:
+                logging.debug("Query already in flight, waiting for leader")
+                waited = True
+
+            time.sleep(self.poll_interval_seconds)
+
+            cached_response = self.get(query)
+            if cached_response is not None:
+                logging.debug("Using response computed by another caller")
+                self._record('coalesced')
+                return cached_response
+            self._raise_if_failed(query, wait_start)
+
+            if time.monotonic() > deadline:
+                logging.debug("Timed out waiting for leader, computing directly")
+                self._record('wait_timeouts')
+                return compute()
+
+    def _raise_if_failed(self, query: str, since: float):
+        error = self._recent_failure(query, since)
+        if error is not None:
+            self._record('failed_waits')
+            raise RuntimeError(f"Upstream call failed for in-flight query: {error}")
+
+    def _record(self, counter: str):
+        """Increment a single-flight counter for this process"""
+        with self._stats_lock:
+            self.stats[counter] += 1
+            if counter == 'hit':
+                self._unflushed_hits += 1
+                return
+        self._append_stats({counter: 1})
+
+    def _append_stats(self, counts: Dict[str, int]):
+        """Append one record to the shared stats log.
+
+        Each record is a single small O_APPEND write, so concurrent processes
+        never interleave or overwrite each other's records and need no lock.
+        """
+        fd = os.open(self.stats_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        try:
+            os.write(fd, (json.dumps(counts) + '\n').encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def flush_stats(self):
+        """Append this process's cache hits to the shared stats log"""
+        with self._stats_lock:
+            hits, self._unflushed_hits = self._unflushed_hits, 0
+        if hits:
+            self._append_stats({'hit': hits})
+
+    def shared_stats(self) -> dict:
+        """Single-flight counters summed over every process using this cache.
+
+        'hit' counts responses served straight from the cache; 'coalesced' is
+        the number of upstream embedding + chat completion round trips saved
+        by waiting on another caller. Hits from processes that are still
+        running show up once they call flush_stats() or exit.
+        """
+        totals: Dict[str, int] = {}
+        try:
+            with open(self.stats_file, 'r') as f:
+                for line in f:
+                    try:
+                        counts = json.loads(line)
+                    except ValueError:
+                        continue
+                    for counter, count in counts.items():
+                        totals[counter] = totals.get(counter, 0) + count
+        except FileNotFoundError:
+            pass
+        return totals
@@ -28,6 +28,7 @@ class ShoeAdvisor:
         self.client = OpenAI()  # This will use OPENAI_API_KEY from environment
         self.knowledge_base = ShoeKnowledgeBase()
         self.knowledge_base.load(kb_directory)
+        self.knowledge_base.watch(kb_directory)  # Pick up new snapshots without a restart
         self.cache = QueryCache()  # Initialize the cache
         
         self.SYSTEM_PROMPT = """You are a knowledgeable running shoe expert. 
@@ -60,67 +61,16 @@ If you can't find enough information in the context, say so."""
         logging.debug(f"Getting response for question: {question}")
         
         try:
-            # Check cache first
-            cached_response = self.cache.get(question)
-            if cached_response:
-                logging.debug("Using cached response")
-                return cached_response
-            
-            # If not in cache, get new response
-            relevant_chunks = self.knowledge_base.search(question, k=3)
-            logging.debug(f"Found {len(relevant_chunks)} relevant chunks")
-            
-            if not relevant_chunks:
-                response = {
-                    "answer": "I couldn't find any relevant information to answer your question.",
-                    "sources": []
-                }
-                self.cache.set(question, response)  # Cache the no-results response
-                return response
-            
-            # Format context
-            context = self.format_context(relevant_chunks)
-            logging.debug("Context formatted successfully")
-            
-            # Create messages for GPT
-            messages = [
-                {"role": "system", "content": self.SYSTEM_PROMPT},
-                {"role": "user", "content": f"""Context:
-{context}
-
-User Question: {question}
-
-Please provide an answer based on the context above."""}
-            ]
-            
-            # Get GPT response
-            logging.debug("Calling OpenAI API")
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                temperature=0.7
+            # Concurrent callers asking the same question share one upstream call
+            # A response without sources (e.g. the knowledge base is still
+            # empty) isn't cached, so it doesn't outlive the problem by 30 days
+            response = self.cache.get_or_compute(
+                question,
+                lambda: self.compute_response(question),
+                cacheable=lambda response: bool(response.get('sources'))
             )
-            
-            answer = response.choices[0].message.content
-            logging.debug("Received response from OpenAI")
-            
-            # Format final response with sources
-            final_response = {
-                "answer": answer,
-                "sources": [
-                    {
-                        "title": chunk['chunk']['metadata']['title'],
-                        "video_id": chunk['chunk']['metadata']['video_id']
-                    }
-                    for chunk in relevant_chunks
-                ]
-            }
-            
-            # Cache the response before returning
-            self.cache.set(question, final_response)
-            logging.debug("Response cached")
-            
-            return final_response
+            logging.debug(f"Single-flight stats: {self.cache.stats}")
+            return response
             
         except Exception as e:
             error_msg = f"Error in get_response: {str(e)}"
@@ -132,6 +82,63 @@ Please provide an answer based on the context above."""}
             # Don't cache error responses
             return response
 
+    def compute_response(self, question: str) -> Dict:
+        """Build a fresh response with retrieval and a chat completion, bypassing the cache"""
+        # Fail instead of answering "no results" when the embedding call fails,
+        # so the outage isn't cached and waiting callers get the error too
+        query_embedding = self.knowledge_base.get_embedding(question)
+        if query_embedding is None:
+            raise RuntimeError("Failed to embed question")
+
+        relevant_chunks = self.knowledge_base.search_by_vector(query_embedding, k=3)
+        logging.debug(f"Found {len(relevant_chunks)} relevant chunks")
+        
+        if not relevant_chunks:
+            return {
+                "answer": "I couldn't find any relevant information to answer your question.",
+                "sources": []
+            }
+        
+        # Format context
+        context = self.format_context(relevant_chunks)
+        logging.debug("Context formatted successfully")
+        
+        # Create messages for GPT
+        messages = [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user", "content": f"""Context:
+{context}
+
+User Question: {question}
+
+Please provide an answer based on the context above."""}
+        ]
+        
+        # Get GPT response
+        logging.debug("Calling OpenAI API")
+        response = self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.7
+        )
+        
+        answer = response.choices[0].message.content
+        logging.debug("Received response from OpenAI")
+        
+        # Format final response with sources
+        return {
+            "answer": answer,
+            "sources": [
+                {
+                    "title": chunk['chunk']['metadata']['title'],
+                    "video_id": chunk['chunk']['metadata']['video_id'],
+                    # Seconds into the video where the chunk starts, for deep links
+                    "start": chunk['chunk']['metadata'].get('start')
+                }
+                for chunk in relevant_chunks
+            ]
+        }
+
 def main():
     logging.debug("Script started")
     
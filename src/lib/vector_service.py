@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import numpy as np
+from dotenv import load_dotenv
+
+from vector_store import SEARCH_FETCH_K, SEARCH_LAMBDA_MULT, SEARCH_MAX_PER_VIDEO, ShoeKnowledgeBase
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+class VectorService:
+    """Serves the local FAISS knowledge base over Pinecone's data plane API.
+
+    Implements POST /query, POST /vectors/upsert and /describe_index_stats,
+    so the Pinecone clients can use it by pointing their index host at this
+    server (PINECONE_INDEX_HOST=http://localhost:5080).
+
+    Upserts take effect immediately but are written to disk as one snapshot
+    within save_interval seconds (or on POST /flush), so a bulk load
+    doesn't rotate snapshots out from under readers.
+
+    Snapshots written by vector_store.py are picked up without a restart,
+    but only while there are no unsaved upserts: reloading then would drop
+    upserts that were already acknowledged. Those upserts are saved on top
+    of the outside snapshot instead.
+    """
+
+    def __init__(self, kb_directory: str = 'shoe_knowledge', save_interval: float = 5.0,
+                 poll_interval: float = 1.0):
+        self.kb_directory = kb_directory
+        self.knowledge_base = ShoeKnowledgeBase()
+        if self.knowledge_base.current_snapshot(kb_directory) is not None or \
+                os.path.exists(os.path.join(kb_directory, 'shoe_knowledge.index')):
+            self.knowledge_base.load(kb_directory)
+        # Guards upserts, saves and reloads; searches never take it
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._dirty_since = 0.0
+        self.save_interval = save_interval
+        self.poll_interval = poll_interval
+        threading.Thread(target=self._sync_loop, name='kb-snapshot-sync', daemon=True).start()
+
+    def _to_match(self, result: Dict) -> Dict:
+        metadata = result['chunk']['metadata']
+        return {
+            'id': f"{metadata['video_id']}_chunk_{metadata['chunk_index']}",
+            # Embeddings are unit length, so squared L2 distance d maps to cosine similarity 1 - d/2
+            'score': 1.0 - result['distance'] / 2.0,
+            'values': [],
+            'metadata': {**metadata, 'chunk_text': result['chunk']['text']}
+        }
+
+    def query(self, body: Dict) -> Dict:
+        if 'vector' not in body:
+            raise ValueError("Only queries by 'vector' are supported")
+        if body.get('filter'):
+            raise ValueError("Metadata filters are not supported")
+
+        top_k = int(body.get('topK', 10))
+        # Same MMR reranking as the Python advisor by default, since the
+        # Pinecone clients can't send these fields. fetchK <= topK with
+        # maxPerVideo null gives Pinecone's plain nearest neighbours
+        max_per_video = body.get('maxPerVideo', SEARCH_MAX_PER_VIDEO)
+        results = self.knowledge_base.search_by_vector(
+            np.array(body['vector'], dtype=np.float32),
+            k=top_k,
+            fetch_k=int(body.get('fetchK', SEARCH_FETCH_K)),
+            lambda_mult=float(body.get('lambdaMult', SEARCH_LAMBDA_MULT)),
+            max_per_video=None if max_per_video is None else int(max_per_video)
+        )
+
+        matches = [self._to_match(result) for result in results]
+        if not body.get('includeMetadata', False):
+            for match in matches:
+                del match['metadata']
+        return {
+            'matches': matches,
+            'namespace': body.get('namespace', ''),
+            'usage': {'readUnits': 1}
+        }
+
+    def upsert(self, body: Dict) -> Dict:
+        chunks: List[Dict] = []
+        for vector in body.get('vectors', []):
+            metadata = dict(vector.get('metadata') or {})
+            text = metadata.pop('chunk_text', '')
+            if 'video_id' not in metadata or 'chunk_index' not in metadata:
+                # Ids follow the '<video_id>_chunk_<i>' convention
+                video_id, _, chunk_index = vector['id'].rpartition('_chunk_')
+                metadata.setdefault('video_id', video_id)
+                metadata.setdefault('chunk_index', int(chunk_index))
+            chunks.append({
+                'embedding': vector['values'],
+                'text': text,
+                'metadata': metadata
+            })
+
+        # Serialise writers; searches keep using the previous index until the swap.
+        # pinecone_setup.py sends all of a video's chunks in one request, so
+        # replacing whole videos drops chunks left over from older chunking
+        with self._write_lock:
+            self.knowledge_base.upsert_embeddings(chunks, replace_videos=True)
+            if not self._dirty:
+                self._dirty = True
+                self._dirty_since = time.monotonic()
+        return {'upsertedCount': len(chunks)}
+
+    def _save(self):
+        # Caller holds _write_lock
+        current = self.knowledge_base.current_snapshot(self.kb_directory)
+        if current is not None and current != self.knowledge_base.snapshot:
+            logging.warning(f"Snapshot {current} was written while upserts were pending; "
+                            f"saving the upserted knowledge base over it")
+        snapshot = self.knowledge_base.save(self.kb_directory)
+        self._dirty = False
+        logging.info(f"Saved snapshot {snapshot}")
+
+    def flush(self):
+        """Write pending upserts to disk as a new snapshot"""
+        with self._write_lock:
+            if self._dirty:
+                self._save()
+
+    def sync(self):
+        """Save upserts pending for save_interval seconds, or, with nothing
+        pending, switch to a newer snapshot written by another process"""
+        with self._write_lock:
+            if self._dirty:
+                if time.monotonic() - self._dirty_since >= self.save_interval:
+                    self._save()
+            else:
+                self.knowledge_base.reload_if_changed(self.kb_directory)
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.sync()
+            except Exception as e:
+                logging.error(f"Failed to sync snapshot: {e}")
+
+    def describe_index_stats(self) -> Dict:
+        index = self.knowledge_base.index
+        return {
+            'namespaces': {'': {'vectorCount': index.ntotal}},
+            'dimension': index.d,
+            'indexFullness': 0.0,
+            'totalVectorCount': index.ntotal
+        }
+
+
+def make_handler(service: VectorService):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive so clients don't pay a TCP handshake per query
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out in separate writes; don't let Nagle delay the body
+        disable_nagle_algorithm = True
+
+        def _send_json(self, status: int, payload: Dict):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_json(self) -> Dict:
+            length = int(self.headers.get('Content-Length', 0))
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def do_POST(self):
+            try:
+                if self.path == '/query':
+                    self._send_json(200, service.query(self._read_json()))
+                elif self.path == '/vectors/upsert':
+                    self._send_json(200, service.upsert(self._read_json()))
+                elif self.path == '/flush':
+                    self._read_json()
+                    service.flush()
+                    self._send_json(200, {})
+                elif self.path == '/describe_index_stats':
+                    self._read_json()
+                    self._send_json(200, service.describe_index_stats())
+                else:
+                    self._send_json(404, {'error': f"Unknown path {self.path}"})
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {'error': str(e)})
+            except Exception as e:
+                logging.error(f"Error handling {self.path}: {e}")
+                self._send_json(500, {'error': 'Failed to process request', 'details': str(e)})
+
+        def do_GET(self):
+            if self.path == '/describe_index_stats':
+                self._send_json(200, service.describe_index_stats())
+            else:
+                self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    return Handler
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.getenv('VECTOR_SERVICE_PORT', 5080))
+    service = VectorService()
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(service))
+    logging.info(f"Serving {service.knowledge_base.index.ntotal} vectors on http://127.0.0.1:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.flush()
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 import json
+import hashlib
+import logging
+import shutil
+import sys
+import threading
 from pathlib import Path
 import numpy as np
 from openai import OpenAI
 import faiss
 import pickle
-from typing import List, Dict
+from typing import List, Dict, Optional
 import time
 
 import os
@@ -12,17 +17,88 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Retrieval defaults, shared by the advisor and the local vector service so
+# both return the same chunks for the same question
+SEARCH_FETCH_K = 50
+SEARCH_LAMBDA_MULT = 0.5
+SEARCH_MAX_PER_VIDEO = 2
+
+def mmr_select(query_embedding: np.ndarray, candidates: np.ndarray, k: int,
+               lambda_mult: float = 0.5, groups: Optional[np.ndarray] = None,
+               max_per_group: Optional[int] = None) -> List[int]:
+    """Pick k candidate rows with Maximal Marginal Relevance.
+
+    Each step takes the candidate maximising
+    lambda * sim(query, c) - (1 - lambda) * max sim(c, already selected),
+    using cosine similarity. If groups (e.g. video ids) and max_per_group are
+    given, no more than max_per_group rows are picked from any one group.
+    Returns positions into candidates in selection order.
+    """
+    if len(candidates) == 0 or k <= 0:
+        return []
+
+    # Cosine similarity via normalised dot products
+    vectors = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = query_embedding / max(float(np.linalg.norm(query_embedding)), 1e-12)
+    relevance = vectors @ query
+
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    if groups is not None and max_per_group is not None:
+        _, group_codes = np.unique(groups, return_inverse=True)
+        group_counts = np.zeros(group_codes.max() + 1, dtype=np.int64)
+
+    selected = []
+    for _ in range(min(k, len(vectors))):
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            break  # Everything left is already picked or over its group cap
+        selected.append(best)
+        available[best] = False
+
+        # Track each candidate's closest similarity to anything selected so far
+        np.maximum(redundancy, vectors @ vectors[best], out=redundancy)
+
+        if groups is not None and max_per_group is not None:
+            group_counts[group_codes[best]] += 1
+            if group_counts[group_codes[best]] >= max_per_group:
+                available[group_codes == group_codes[best]] = False
+
+    return selected
+
+def chunk_id(video_id: str, chunk_index: int) -> int:
+    """Stable 63-bit FAISS id for a chunk, derived from the same
+    '<video_id>_chunk_<i>' key used for Pinecone vector ids"""
+    digest = hashlib.blake2b(f"{video_id}_chunk_{chunk_index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') & ((1 << 63) - 1)
+
 class ShoeKnowledgeBase:
+    # Pointer file naming the snapshot directory that readers should use
+    POINTER_FILE = 'CURRENT'
+    SNAPSHOTS_TO_KEEP = 3
+
     def __init__(self):
         # Initialize OpenAI client
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         
         # Initialize FAISS index
-        # 1536 is the dimensionality of OpenAI's text-embedding-3-small embeddings
-        self.index = faiss.IndexFlatL2(1536)
+        # 1536 is the dimensionality of OpenAI's text-embedding-3-small embeddings.
+        # Vectors are stored under stable chunk ids rather than list positions
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(1536))
+        
+        # Store mapping of chunk ids to chunk data
+        self.chunk_data: Dict[int, Dict] = {}
         
-        # Store mapping of FAISS index positions to chunk data
-        self.chunk_data: List[Dict] = []
+        # Swapping index and chunk_data together must look atomic to searches
+        self._lock = threading.Lock()
+        self.snapshot: Optional[str] = None
+        self._watcher: Optional[threading.Thread] = None
     
     def get_embedding(self, text: str) -> np.ndarray:
         """Get embedding vector for a text using OpenAI's API"""
@@ -41,80 +117,297 @@ class ShoeKnowledgeBase:
             return None
 
     def add_chunk(self, text: str, metadata: Dict):
-        """Add a single chunk to the knowledge base"""
+        """Add a single chunk to the knowledge base, replacing any chunk with the same id"""
         embedding = self.get_embedding(text)
         if embedding is not None:
-            # Add to FAISS index
-            self.index.add(embedding.reshape(1, -1))
-            # Store chunk data at same position
-            self.chunk_data.append({
+            idx = chunk_id(metadata['video_id'], metadata['chunk_index'])
+            ids = np.array([idx], dtype=np.int64)
+            if idx in self.chunk_data:
+                self.index.remove_ids(ids)
+            # Add to FAISS index under the chunk's stable id
+            self.index.add_with_ids(embedding.reshape(1, -1), ids)
+            self.chunk_data[idx] = {
                 'text': text,
                 'metadata': metadata
-            })
+            }
     
-    def process_chunks_directory(self, chunks_dir: str):
-        """Process all chunks in directory"""
+    def upsert_embeddings(self, chunks: List[Dict], replace_videos: bool = False):
+        """Add or replace already embedded chunks while searches keep running.
+
+        Each chunk is a dict with 'embedding', 'text' and 'metadata' (which
+        needs 'video_id' and 'chunk_index'). With replace_videos, every
+        existing chunk of a video in the batch is dropped first, like
+        add_video. The index is copied, updated and swapped in, so concurrent
+        searches never see a half-applied batch.
+        """
+        if not chunks:
+            return
+        
+        with self._lock:
+            index, chunk_data = self.index, self.chunk_data
+        index = faiss.clone_index(index)
+        chunk_data = dict(chunk_data)
+        
+        # Later chunks in the batch win if an id repeats
+        batch = {chunk_id(c['metadata']['video_id'], c['metadata']['chunk_index']): c for c in chunks}
+        ids = np.array(list(batch), dtype=np.int64)
+        if replace_videos:
+            video_ids = {c['metadata']['video_id'] for c in chunks}
+            stale = [idx for idx, chunk in chunk_data.items() if chunk['metadata']['video_id'] in video_ids]
+        else:
+            stale = [idx for idx in batch if idx in chunk_data]
+        if stale:
+            index.remove_ids(np.array(stale, dtype=np.int64))
+            for idx in stale:
+                del chunk_data[idx]
+        index.add_with_ids(np.array([c['embedding'] for c in batch.values()], dtype=np.float32), ids)
+        for idx, chunk in batch.items():
+            chunk_data[idx] = {
+                'text': chunk['text'],
+                'metadata': chunk['metadata']
+            }
+        
+        with self._lock:
+            self.index, self.chunk_data = index, chunk_data
+    
+    def video_chunk_ids(self, video_id: str) -> List[int]:
+        """Ids of every chunk belonging to a video"""
+        return [idx for idx, chunk in self.chunk_data.items()
+                if chunk['metadata']['video_id'] == video_id]
+    
+    def remove_video(self, video_id: str) -> int:
+        """Remove all chunks of a video, returning how many were removed"""
+        ids = self.video_chunk_ids(video_id)
+        if ids:
+            self.index.remove_ids(np.array(ids, dtype=np.int64))
+            for idx in ids:
+                del self.chunk_data[idx]
+        return len(ids)
+    
+    def add_video(self, video_id: str, chunks: List[Dict]):
+        """Replace all chunks of a video (e.g. after it was re-transcribed)"""
+        removed = self.remove_video(video_id)
+        if removed:
+            print(f"Removed {removed} old chunks for video {video_id}")
+        for chunk in chunks:
+            self.add_chunk(chunk['text'], chunk['metadata'])
+    
+    def process_chunks_directory(self, chunks_dir: str, video_ids: Optional[List[str]] = None):
+        """Process all chunks in directory, or only those of the given videos.
+
+        Requested videos that no longer have any chunk files are removed.
+        """
         chunks_path = Path(chunks_dir)
         print(f"Processing chunks from {chunks_path}")
         
-        for chunk_file in chunks_path.glob('chunk_*.json'):
+        # Group chunk files by video so each video is replaced as a whole
+        videos: Dict[str, List[Dict]] = {}
+        for chunk_file in sorted(chunks_path.glob('chunk_*.json')):
             with open(chunk_file, 'r', encoding='utf-8') as f:
                 chunk = json.load(f)
-                print(f"Processing {chunk_file.name}")
-                self.add_chunk(chunk['text'], chunk['metadata'])
+            video_id = chunk['metadata']['video_id']
+            if video_ids is None or video_id in video_ids:
+                videos.setdefault(video_id, []).append(chunk)
+        
+        for video_id, chunks in videos.items():
+            print(f"Processing {len(chunks)} chunks for video {video_id}")
+            self.add_video(video_id, chunks)
+        
+        for video_id in video_ids or []:
+            if video_id not in videos:
+                removed = self.remove_video(video_id)
+                print(f"Removed {removed} chunks for video {video_id} (no chunk files left)")
     
-    def save(self, directory: str):
-        """Save the knowledge base to disk"""
+    def save(self, directory: str) -> str:
+        """Save the knowledge base to disk as a new snapshot.
+
+        Files are written to a fresh snapshots/<version> directory and the
+        CURRENT pointer is then swapped atomically, so readers only ever see
+        a complete snapshot. Returns the snapshot name.
+        """
         save_dir = Path(directory)
-        save_dir.mkdir(exist_ok=True)
+        snapshots_dir = save_dir / 'snapshots'
+        snapshots_dir.mkdir(parents=True, exist_ok=True)
+        
+        snapshot = f"{time.time_ns()}"
+        tmp_dir = snapshots_dir / f".{snapshot}.tmp"
+        tmp_dir.mkdir()
+        
+        # Write one consistent pair even if an upsert or reload swaps it meanwhile
+        with self._lock:
+            index, chunk_data = self.index, self.chunk_data
         
         # Save FAISS index
-        faiss.write_index(self.index, str(save_dir / 'shoe_knowledge.index'))
+        faiss.write_index(index, str(tmp_dir / 'shoe_knowledge.index'))
         
         # Save chunk data
-        with open(save_dir / 'chunk_data.pkl', 'wb') as f:
-            pickle.dump(self.chunk_data, f)
+        with open(tmp_dir / 'chunk_data.pkl', 'wb') as f:
+            pickle.dump(chunk_data, f)
+        
+        os.replace(tmp_dir, snapshots_dir / snapshot)
+        
+        # Point readers at the new snapshot
+        tmp_pointer = save_dir / f".{self.POINTER_FILE}.tmp"
+        tmp_pointer.write_text(snapshot)
+        os.replace(tmp_pointer, save_dir / self.POINTER_FILE)
+        self.snapshot = snapshot
+        
+        # Drop old snapshots, keeping a few for readers still loading them
+        old_snapshots = sorted(p for p in snapshots_dir.iterdir() if not p.name.startswith('.'))
+        for old in old_snapshots[:-self.SNAPSHOTS_TO_KEEP]:
+            shutil.rmtree(old, ignore_errors=True)
+        
+        return snapshot
+    
+    def current_snapshot(self, directory: str) -> Optional[str]:
+        """Name of the snapshot the CURRENT pointer refers to, if any"""
+        try:
+            return (Path(directory) / self.POINTER_FILE).read_text().strip()
+        except FileNotFoundError:
+            return None
+    
+    def _read_snapshot(self, load_dir: Path):
+        """Read an index and its chunk data from a directory"""
+        index = faiss.read_index(str(load_dir / 'shoe_knowledge.index'))
+        with open(load_dir / 'chunk_data.pkl', 'rb') as f:
+            chunk_data = pickle.load(f)
+        
+        if isinstance(chunk_data, list):
+            # Legacy layout: positional ids into a flat index, re-key by stable id
+            vectors = index.reconstruct_n(0, index.ntotal)
+            ids = np.array([chunk_id(c['metadata']['video_id'], c['metadata']['chunk_index'])
+                            for c in chunk_data], dtype=np.int64)
+            index = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+            index.add_with_ids(vectors, ids)
+            chunk_data = dict(zip(ids.tolist(), chunk_data))
+        
+        return index, chunk_data
     
     def load(self, directory: str):
         """Load the knowledge base from disk"""
         load_dir = Path(directory)
         
-        # Load FAISS index
-        self.index = faiss.read_index(str(load_dir / 'shoe_knowledge.index'))
+        for attempt in range(3):
+            snapshot = self.current_snapshot(directory)
+            if snapshot is None:
+                # Knowledge base saved before snapshots were introduced
+                index, chunk_data = self._read_snapshot(load_dir)
+                break
+            try:
+                index, chunk_data = self._read_snapshot(load_dir / 'snapshots' / snapshot)
+                break
+            except FileNotFoundError:
+                # A writer rotated the snapshot out after we read CURRENT;
+                # retry with the newer pointer
+                if attempt == 2 or self.current_snapshot(directory) == snapshot:
+                    raise
         
-        # Load chunk data
-        with open(load_dir / 'chunk_data.pkl', 'rb') as f:
-            self.chunk_data = pickle.load(f)
+        with self._lock:
+            self.index, self.chunk_data = index, chunk_data
+            self.snapshot = snapshot
     
-    def search(self, query: str, k: int = 3) -> List[Dict]:
-        """Search for most relevant chunks"""
+    def reload_if_changed(self, directory: str) -> bool:
+        """Switch to a newer snapshot if the CURRENT pointer moved"""
+        snapshot = self.current_snapshot(directory)
+        if snapshot is None or snapshot == self.snapshot:
+            return False
+        try:
+            self.load(directory)
+        except Exception as e:
+            # Leave the current snapshot in place and retry on the next check
+            logging.error(f"Failed to load snapshot {snapshot}: {e}")
+            return False
+        logging.info(f"Switched to knowledge base snapshot {snapshot}")
+        return True
+    
+    def watch(self, directory: str, interval: float = 1.0):
+        """Poll for new snapshots in a background thread.
+
+        The new snapshot is fully loaded off the request path and swapped in
+        with a single reference assignment, so searches never wait on disk.
+        """
+        if self._watcher is not None:
+            return
+        
+        def poll():
+            while True:
+                time.sleep(interval)
+                self.reload_if_changed(directory)
+        
+        self._watcher = threading.Thread(target=poll, name='kb-snapshot-watcher', daemon=True)
+        self._watcher.start()
+    
+    def search(self, query: str, k: int = 3, fetch_k: int = SEARCH_FETCH_K,
+               lambda_mult: float = SEARCH_LAMBDA_MULT,
+               max_per_video: Optional[int] = SEARCH_MAX_PER_VIDEO) -> List[Dict]:
+        """Search for most relevant chunks.
+
+        Over-fetches fetch_k nearest neighbours, then picks the final k with
+        Maximal Marginal Relevance so results aren't overlapping slices of the
+        same video. max_per_video caps how many chunks come from one video;
+        fetch_k <= k with max_per_video=None gives plain nearest neighbours.
+        """
         # Get query embedding
         query_embedding = self.get_embedding(query)
         if query_embedding is None:
             return []
         
+        return self.search_by_vector(query_embedding, k, fetch_k, lambda_mult, max_per_video)
+    
+    def search_by_vector(self, query_embedding: np.ndarray, k: int = 3, fetch_k: int = SEARCH_FETCH_K,
+                         lambda_mult: float = SEARCH_LAMBDA_MULT,
+                         max_per_video: Optional[int] = SEARCH_MAX_PER_VIDEO) -> List[Dict]:
+        """Search with an already computed query embedding (see search)"""
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        
+        # Use one consistent snapshot even if a reload lands mid-search
+        with self._lock:
+            index, chunk_data = self.index, self.chunk_data
+        
         # Search in FAISS
-        distances, indices = self.index.search(query_embedding.reshape(1, -1), k)
+        fetch_k = min(max(fetch_k, k), index.ntotal)
+        if fetch_k == 0:
+            return []
+        distances, indices = index.search(query_embedding.reshape(1, -1), fetch_k)
+        found = indices[0] >= 0
+        distances, indices = distances[0][found], indices[0][found].tolist()
+        
+        if fetch_k > k or max_per_video is not None:
+            # Rerank the candidates from their stored vectors
+            candidates = index.reconstruct_batch(np.array(indices, dtype=np.int64))
+            video_ids = np.array([chunk_data[idx]['metadata']['video_id'] for idx in indices])
+            order = mmr_select(query_embedding, candidates, k, lambda_mult,
+                               groups=video_ids, max_per_group=max_per_video)
+        else:
+            order = range(min(k, len(indices)))
         
         # Return relevant chunks
         results = []
-        for i, idx in enumerate(indices[0]):
+        for i in order:
             results.append({
-                'chunk': self.chunk_data[idx],
-                'distance': float(distances[0][i])
+                'id': indices[i],
+                'chunk': chunk_data[indices[i]],
+                'distance': float(distances[i])
             })
         
         return results
 
 def main():
-    # Initialize knowledge base
     kb = ShoeKnowledgeBase()
     
-    # Process all chunks
-    kb.process_chunks_directory('processed_chunks')
+    # With video ids as arguments, only re-embed (or remove, if their chunk
+    # files are gone) those videos on top of the current snapshot; otherwise
+    # rebuild from every chunk
+    video_ids = sys.argv[1:] or None
+    if video_ids:
+        kb.load('shoe_knowledge')
+    
+    # Process chunks
+    kb.process_chunks_directory('processed_chunks', video_ids)
     
-    # Save the knowledge base
-    kb.save('shoe_knowledge')
+    # Save the knowledge base as a new snapshot
+    snapshot = kb.save('shoe_knowledge')
+    print(f"Saved snapshot {snapshot}")
     
     # Example search
     print("\nTesting search...")
@@ -126,4 +419,4 @@ def main():
         print(f"Distance: {result['distance']}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -6,6 +6,7 @@ from youtube_transcript_api.formatters import TextFormatter
 import json
 import logging
 from pathlib import Path
+from corpus_store import CorpusStore, migrate_legacy_json
 
 import os
 from dotenv import load_dotenv
@@ -97,8 +98,17 @@ class YouTubeCaptionCollector:
             return None
 
     def process_channel(self, channel_id: str, output_dir: str, months_back: int = 24) -> List[Dict]:
-        transcript_dir = Path(output_dir) / 'transcripts'
-        transcript_dir.mkdir(parents=True, exist_ok=True)
+        """Fetch captions for a channel's recent videos into its corpus store.
+
+        Videos already in the store are not fetched again, and transcripts
+        cached by older versions (processed_videos.json, transcripts/) are
+        moved into it. Returns the metadata of every video with a transcript.
+        """
+        migrated = migrate_legacy_json(Path(output_dir))
+        if migrated:
+            self.logger.info(f"Migrated {migrated} videos from processed_videos.json")
+        store = CorpusStore(output_dir)
+        legacy_transcript_dir = Path(output_dir) / 'transcripts'
         
         published_after = datetime.now() - timedelta(days=30.44 * months_back)
         
@@ -106,25 +116,39 @@ class YouTubeCaptionCollector:
         self.logger.info(f"Found {len(videos)} videos for channel {channel_id}")
         
         processed_videos = []
+        new_videos = 0
         
         for video in videos:
             video_id = video['video_id']
-            transcript_path = transcript_dir / f"{video_id}.json"
             
-            if transcript_path.exists():
-                with open(transcript_path, 'r') as f:
+            if video_id in store:
+                processed_videos.append(video)
+                continue
+            
+            # Reuse transcripts cached by older versions of this script
+            legacy_path = legacy_transcript_dir / f"{video_id}.json"
+            if legacy_path.exists():
+                with open(legacy_path, 'r') as f:
                     transcript = json.load(f)
             else:
                 transcript = self.get_video_captions(video_id)
-                if transcript:
-                    with open(transcript_path, 'w') as f:
-                        json.dump(transcript, f, indent=2)
             
             if transcript:
-                processed_videos.append({
+                # Store as we go so an interrupted run keeps what it fetched
+                store.put({
                     **video,
                     'transcript': transcript
                 })
+                # The store now holds the only copy
+                legacy_path.unlink(missing_ok=True)
+                processed_videos.append(video)
+                new_videos += 1
+        
+        self.logger.info(f"Stored {new_videos} new transcripts in {store.data_path}")
+        
+        if store.garbage_bytes():
+            store.compact()
+            self.logger.info(f"Compacted {store.data_path}")
             
         return processed_videos
 
@@ -159,9 +183,7 @@ def main():
         print(f"Processing channel {channel['name']}.\n")
         output_dir = f"data/{channel['name'].lower().replace(' ', '_')}"
         videos = collector.process_channel(channel['id'], output_dir)
-        
-        with open(f"{output_dir}/processed_videos.json", 'w') as f:
-            json.dump(videos, f, indent=2)
+        print(f"{len(videos)} videos with transcripts in {output_dir}\n")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file